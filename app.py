@@ -1,119 +1,159 @@
 from flask import Flask, render_template, request
-import math, random, threading, time
-from dataclasses import dataclass
-from typing import List
+import html, math, os, random, threading
+from dataclasses import dataclass, replace
+from functools import lru_cache
+import numpy as np
+import orjson
 import folium
+from branca.element import MacroElement
+from jinja2 import Template
 import paho.mqtt.client as mqtt
+from tsp_core import (local_distance_matrix, route_length_km,
+                      nearest_neighbor_route, two_opt)
 
 # ------------------------- CONFIG -------------------------
 random.seed(42)
+rng = np.random.default_rng(42)
 DRY_THRESHOLD = 30.0
 MQTT_BROKER = "broker.hivemq.com"
 MQTT_PORT = 1883
+MQTT_TOPIC = "farm/all/moisture"  # one JSON payload {sensor_id: moisture}
 SENSOR_UPDATE_INTERVAL = 3  # seconds
 CENTER_DEFAULT = (12.969, 79.159)  # VIT Vellore
 
 # ------------------------- DATA CLASS -------------------------
 @dataclass
-class Sensor:
-    id: str
-    lat: float
-    lon: float
-    moisture: float
+class SensorArrays:
+    ids: np.ndarray
+    lats: np.ndarray
+    lons: np.ndarray
+    moisture: np.ndarray
 
-sensors: List[Sensor] = []
+    def __len__(self):
+        return len(self.ids)
+
+sensors = SensorArrays(np.empty(0, dtype=object), np.empty(0), np.empty(0), np.empty(0))
 
 # ------------------------- MQTT -------------------------
 client = mqtt.Client()
 
-def mqtt_publish(sensor: Sensor):
-    topic = f"farm/{sensor.id}/moisture"
-    client.publish(topic, sensor.moisture)
-
-def mqtt_loop():
-    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+def mqtt_publish(fleet: SensorArrays):
+    payload = dict(zip(fleet.ids.tolist(), fleet.moisture.tolist()))
+    client.publish(MQTT_TOPIC, orjson.dumps(payload))
+
+def mqtt_tick():
+    timer = threading.Timer(SENSOR_UPDATE_INTERVAL, mqtt_tick)
+    timer.daemon = True
+    timer.start()
+    fleet = sensors
+    fleet.moisture = np.clip(fleet.moisture + rng.uniform(-5, 3, len(fleet)), 0, 100)
+    mqtt_publish(fleet)
+
+def mqtt_start():
+    # paho's own network thread handles the socket; moisture updates are
+    # driven by a self-rescheduling timer instead of a sleeping loop.
+    client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
     client.loop_start()
-    while True:
-        for s in sensors:
-            s.moisture = max(0, min(100, s.moisture + random.uniform(-5, 3)))
-            mqtt_publish(s)
-        time.sleep(SENSOR_UPDATE_INTERVAL)
+    mqtt_tick()
 
 # ------------------------- HELPERS -------------------------
 def km_to_deg_lat(km): return km / 111.0
-def km_to_deg_lon(km, lat): return km / (111.0 * max(0.1, math.cos(math.radians(lat))))
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (math.sin(dlat / 2) ** 2 +
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-         math.sin(dlon / 2) ** 2)
-    return 2 * R * math.asin(math.sqrt(a))
-
-def total_path_length_km(points):
-    return sum(haversine(points[i][0], points[i][1],
-                         points[i + 1][0], points[i + 1][1])
-               for i in range(len(points) - 1)) if len(points) > 1 else 0
-
-def nearest_neighbor_route(coords):
-    n = len(coords)
-    unvisited = set(range(1, n))
-    route = [0]; current = 0
-    while unvisited:
-        nxt = min(unvisited, key=lambda j: haversine(
-            coords[current][0], coords[current][1],
-            coords[j][0], coords[j][1]))
-        route.append(nxt)
-        unvisited.remove(nxt)
-        current = nxt
-    route.append(0)
-    return route
-
-def two_opt(route, coords, max_iters=200):
-    best = route[:]
-    best_len = total_path_length_km([coords[i] for i in best])
-    improved = True
-    iters = 0
-    while improved and iters < max_iters:
-        improved = False
-        iters += 1
-        for i in range(1, len(best) - 2):
-            for k in range(i + 1, len(best) - 1):
-                new_route = best[:i] + best[i:k + 1][::-1] + best[k + 1:]
-                new_len = total_path_length_km([coords[j] for j in new_route])
-                if new_len < best_len:
-                    best, best_len, improved = new_route, new_len, True
-    return best
-
-def sample_point_in_disc(lat0, lon0, radius_km):
-    r = radius_km * math.sqrt(random.random())
-    theta = random.random() * 2 * math.pi
-    return (lat0 + km_to_deg_lat(r) * math.sin(theta),
-            lon0 + km_to_deg_lon(r, lat0) * math.cos(theta))
+@lru_cache(maxsize=8)
+def deg_lon_per_km(lat): return 1.0 / (111.0 * max(0.1, math.cos(math.radians(lat))))
+def km_to_deg_lon(km, lat): return km * deg_lon_per_km(lat)
+
+def sample_points_in_disc(lat0, lon0, radius_km, n):
+    r = radius_km * np.sqrt(rng.random(n))
+    theta = rng.random(n) * 2 * np.pi
+    return (lat0 + km_to_deg_lat(r) * np.sin(theta),
+            lon0 + km_to_deg_lon(r, lat0) * np.cos(theta))
 
 def random_sensors(n, center_lat, center_lon, radius_km):
-    return [
-        Sensor(
-            id=f"SENSOR_{i + 1}",
-            lat=sample_point_in_disc(center_lat, center_lon, radius_km)[0],
-            lon=sample_point_in_disc(center_lat, center_lon, radius_km)[1],
-            moisture=random.uniform(0, 100)
-        ) for i in range(n)
-    ]
+    lats, lons = sample_points_in_disc(center_lat, center_lon, radius_km, n)
+    ids = np.array([f"SENSOR_{i + 1}" for i in range(n)], dtype=object)
+    return SensorArrays(ids, lats, lons, rng.uniform(0, 100, n))
+
+# ------------------------- MAPS -------------------------
+# The Leaflet page for a given center is rendered once; each view only
+# splices its marker/polyline JS into the slot left in the map script.
+MAP_LAYERS_SLOT = "/*MAP_LAYERS*/"
+
+class MapLayersSlot(MacroElement):
+    _template = Template("{% macro script(this, kwargs) %}" + MAP_LAYERS_SLOT + "{% endmacro %}")
+
+@lru_cache(maxsize=8)
+def base_map_html(center_lat, center_lon):
+    m = folium.Map(location=[center_lat, center_lon], zoom_start=15)
+    MapLayersSlot().add_to(m)
+    return m.get_name(), m._repr_html_()
+
+MARKERS_JS = ("%s.forEach(function (p) {\n"
+              "  L.marker([p[0], p[1]], {icon: L.AwesomeMarkers.icon({markerColor: p[2],"
+              " iconColor: \"white\", icon: \"info-sign\", prefix: \"glyphicon\"})})"
+              ".bindPopup(p[3]).addTo(map);\n});")
+
+def markers_js(lats, lons, popups, colors):
+    pts = [[lat, lon, color, popup] for lat, lon, color, popup
+           in zip(np.asarray(lats).tolist(), np.asarray(lons).tolist(), colors, popups)]
+    return MARKERS_JS % orjson.dumps(pts).decode()
+
+def polyline_js(points, color, weight):
+    points = np.asarray(points, dtype=np.float64).tolist()
+    style = orjson.dumps({"color": color, "weight": weight}).decode()
+    return f"L.polyline({orjson.dumps(points).decode()}, {style}).addTo(map);"
+
+def render_map(center_lat, center_lon, layers):
+    map_name, page = base_map_html(center_lat, center_lon)
+    js = "(function (map) {\n" + "\n".join(layers) + f"\n}})({map_name});"
+    return page.replace(MAP_LAYERS_SLOT, html.escape(js))
+
+# MAP 1: All Sensors
+def build_map_all(center_lat, center_lon, fleet, power_per_sensor_mV):
+    moist = fleet.moisture.tolist()
+    colors = ["red" if m < DRY_THRESHOLD else "orange" if m < 60 else "green" for m in moist]
+    popups = [f"{sid}: {m:.1f}% | {power_per_sensor_mV:.0f} mV" for sid, m in zip(fleet.ids, moist)]
+    return render_map(center_lat, center_lon,
+                      [markers_js(fleet.lats, fleet.lons, popups, colors)])
+
+# MAP 2: Route Optimized View
+def build_map_route(center_lat, center_lon, fleet, dry_idx, route_coords):
+    popups = [f"{sid}: dry {m:.1f}%"
+              for sid, m in zip(fleet.ids[dry_idx], fleet.moisture[dry_idx].tolist())]
+    return render_map(center_lat, center_lon, [
+        polyline_js(route_coords, color="blue", weight=4),
+        markers_js(fleet.lats[dry_idx], fleet.lons[dry_idx], popups, ["red"] * len(dry_idx)),
+    ])
+
+# MAP 3: Power Station Planning View
+def build_map_power(center_lat, center_lon, fleet, power_stations, station_power_mV):
+    st_lats = [lat for lat, _ in power_stations]
+    st_lons = [lon for _, lon in power_stations]
+    st_popups = [f"Power Station #{i}\nOutput: {station_power_mV:.0f} mV"
+                 for i in range(1, len(power_stations) + 1)]
+    moist = fleet.moisture.tolist()
+    colors = ["red" if m < DRY_THRESHOLD else "green" for m in moist]
+    popups = [f"{sid}: {m:.1f}%" for sid, m in zip(fleet.ids, moist)]
+    return render_map(center_lat, center_lon, [
+        markers_js(st_lats, st_lons, st_popups, ["purple"] * len(power_stations)),
+        markers_js(fleet.lats, fleet.lons, popups, colors),
+    ])
 
 # ------------------------- SIMULATION -------------------------
-def run_simulation(center_lat, center_lon, radius_km, n_sensors,
-                   tile_area_mm2, power_per_sensor_mV):
-    global sensors
-    sensors = random_sensors(n_sensors, center_lat, center_lon, radius_km)
-    dry = [s for s in sensors if s.moisture < DRY_THRESHOLD]
+@lru_cache(maxsize=16)
+def simulate(center_lat, center_lon, radius_km, n_sensors,
+             tile_area_mm2, power_per_sensor_mV):
+    fleet = random_sensors(n_sensors, center_lat, center_lon, radius_km)
+    dry_idx = np.flatnonzero(fleet.moisture < DRY_THRESHOLD)
 
     DEPOT = {"lat": center_lat, "lon": center_lon}
-    coords = [(DEPOT["lat"], DEPOT["lon"])] + [(s.lat, s.lon) for s in dry]
-    route_idx = two_opt(nearest_neighbor_route(coords), coords)
-    nn_dist = total_path_length_km([coords[i] for i in nearest_neighbor_route(coords)])
-    opt_dist = total_path_length_km([coords[i] for i in route_idx])
+    coords = np.concatenate([[[DEPOT["lat"], DEPOT["lon"]]],
+                             np.column_stack([fleet.lats[dry_idx],
+                                              fleet.lons[dry_idx]])])
+    D = local_distance_matrix(coords)
+    nn_route = nearest_neighbor_route(D)
+    route_idx = two_opt(nn_route, D)
+    nn_dist = route_length_km(coords, nn_route)
+    opt_dist = route_length_km(coords, route_idx)
 
     total_area_m2 = (tile_area_mm2 * n_sensors) / 1_000_000
     total_power = power_per_sensor_mV * n_sensors
@@ -133,54 +173,31 @@ def run_simulation(center_lat, center_lon, radius_km, n_sensors,
         lon = center_lon + km_to_deg_lon(lon_offset, center_lat)
         power_stations.append((lat, lon))
 
-    # MAP 1: All Sensors
-    m1 = folium.Map(location=[center_lat, center_lon], zoom_start=15)
-    for s in sensors:
-        color = "red" if s.moisture < DRY_THRESHOLD else "orange" if s.moisture < 60 else "green"
-        folium.Marker(
-            [s.lat, s.lon],
-            popup=f"{s.id}: {s.moisture:.1f}% | {power_per_sensor_mV:.0f} mV",
-            icon=folium.Icon(color=color)
-        ).add_to(m1)
-
-    # MAP 2: Route Optimized View
-    m2 = folium.Map(location=[center_lat, center_lon], zoom_start=15)
-    route_coords = [coords[i] for i in route_idx]
-    folium.PolyLine(route_coords, color="blue", weight=4).add_to(m2)
-    for s in dry:
-        folium.Marker(
-            [s.lat, s.lon],
-            popup=f"{s.id}: dry {s.moisture:.1f}%",
-            icon=folium.Icon(color="red")
-        ).add_to(m2)
-
-    # MAP 3: Power Station Planning View
-    m3 = folium.Map(location=[center_lat, center_lon], zoom_start=15)
-    for i, (lat, lon) in enumerate(power_stations, 1):
-        folium.Marker(
-            [lat, lon],
-            popup=f"Power Station #{i}\nOutput: {station_power_mV:.0f} mV",
-            icon=folium.Icon(color="purple", icon="info-sign")
-        ).add_to(m3)
-
-    for s in sensors:
-        color = "red" if s.moisture < DRY_THRESHOLD else "green"
-        folium.Marker(
-            [s.lat, s.lon],
-            popup=f"{s.id}: {s.moisture:.1f}%",
-            icon=folium.Icon(color=color)
-        ).add_to(m3)
-
-    return (
-        m1._repr_html_(),
-        m2._repr_html_(),
-        m3._repr_html_(),
-        len(sensors), len(dry),
+    route_coords = coords[route_idx]
+    map_all = build_map_all(center_lat, center_lon, fleet, power_per_sensor_mV)
+    map_route = build_map_route(center_lat, center_lon, fleet, dry_idx, route_coords)
+    map_power = build_map_power(center_lat, center_lon, fleet,
+                                power_stations, station_power_mV)
+
+    return fleet, (
+        map_all, map_route, map_power,
+        len(fleet), len(dry_idx),
         nn_dist, opt_dist,
         total_area_m2, total_power, optimized_power,
         num_stations, total_station_output, station_power_mV
     )
 
+def run_simulation(center_lat, center_lon, radius_km, n_sensors,
+                   tile_area_mm2, power_per_sensor_mV):
+    # Identical form submissions reuse the cached run (same field and maps)
+    # until it is evicted. The MQTT feed drifts its own copy of the moisture
+    # readings so the cached entry stays as it was rendered.
+    global sensors
+    fleet, result = simulate(center_lat, center_lon, radius_km, n_sensors,
+                             tile_area_mm2, power_per_sensor_mV)
+    sensors = replace(fleet, moisture=fleet.moisture.copy())
+    return result
+
 # ------------------------- FLASK -------------------------
 app = Flask(__name__)
 
@@ -220,5 +237,8 @@ def index():
 
 # ------------------------- RUN -------------------------
 if __name__ == "__main__":
-    threading.Thread(target=mqtt_loop, daemon=True).start()
+    # debug=True re-executes this module in a reloader child; only that
+    # process serves requests, so only it runs the MQTT feed.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        mqtt_start()
     app.run(debug=True)
@@ -0,0 +1,134 @@
+import math
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # e.g. platforms without llvmlite wheels; use the NumPy kernels
+    njit = None
+
+R_EARTH_KM = 6371.0
+
+# ------------------------- DISTANCES -------------------------
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) *
+         np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * R_EARTH_KM * np.arctan2(np.sqrt(a), np.sqrt(1.0 - a))
+
+def _split_coords(coords):
+    pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    return np.ascontiguousarray(pts[:, 0]), np.ascontiguousarray(pts[:, 1])
+
+def local_distance_matrix(coords):
+    # Equirectangular projection around the first point. Over a few km it
+    # agrees with haversine to within centimetres, which is plenty for
+    # ranking route edges, and needs no trig per pair. Reported lengths
+    # still go through route_length_km.
+    lats, lons = _split_coords(coords)
+    if len(lats) == 0:
+        return np.zeros((0, 0))
+    x = np.radians(lons - lons[0]) * R_EARTH_KM * math.cos(math.radians(lats[0]))
+    y = np.radians(lats - lats[0]) * R_EARTH_KM
+    return np.sqrt((x[:, None] - x) ** 2 + (y[:, None] - y) ** 2)
+
+def route_length_km(coords, route):
+    lats, lons = _split_coords(coords)
+    route = np.asarray(route, dtype=np.int64)
+    if len(route) < 2:
+        return 0
+    a, b = route[:-1], route[1:]
+    return float(haversine(lats[a], lons[a], lats[b], lons[b]).sum())
+
+# ------------------------- ROUTING (NumPy) -------------------------
+def nearest_neighbor_route(D):
+    n = len(D)
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    route = np.zeros(n + 1, dtype=np.int64)
+    current = 0
+    d = np.empty(n)
+    for step in range(1, n):
+        np.copyto(d, D[current])
+        d[visited] = np.inf
+        current = int(d.argmin())
+        visited[current] = True
+        route[step] = current
+    return route
+
+def two_opt(route, D, max_iters=200):
+    best = np.array(route, dtype=np.int64)
+    improved = True
+    iters = 0
+    while improved and iters < max_iters:
+        improved = False
+        iters += 1
+        for i in range(1, len(best) - 2):
+            a, b = best[i - 1], best[i]
+            c, d = best[i + 1:-1], best[i + 2:]
+            delta = D[a, c] + D[b, d] - D[a, b] - D[c, d]
+            k = int(delta.argmin())
+            if delta[k] < -1e-12:
+                best[i:i + 2 + k] = best[i:i + 2 + k][::-1]
+                improved = True
+    return best
+
+# ------------------------- ROUTING (Numba) -------------------------
+if njit is not None:
+    @njit(nogil=True)
+    def _nn_route(D):
+        n = D.shape[0]
+        visited = np.zeros(n, dtype=np.bool_)
+        visited[0] = True
+        route = np.zeros(n + 1, dtype=np.int64)
+        current = 0
+        for step in range(1, n):
+            nxt, best = -1, np.inf
+            for j in range(n):
+                if not visited[j] and D[current, j] < best:
+                    nxt, best = j, D[current, j]
+            visited[nxt] = True
+            route[step] = nxt
+            current = nxt
+        return route
+
+    @njit(nogil=True)
+    def _reverse(route, i, k):
+        while i < k:
+            route[i], route[k] = route[k], route[i]
+            i += 1
+            k -= 1
+
+    @njit(fastmath=True, nogil=True)
+    def _two_opt(route, D, max_iters):
+        n = route.shape[0]
+        improved = True
+        iters = 0
+        while improved and iters < max_iters:
+            improved = False
+            iters += 1
+            for i in range(1, n - 2):
+                a, b = route[i - 1], route[i]
+                best_k, best_delta = -1, -1e-12
+                for k in range(i + 1, n - 1):
+                    c, d = route[k], route[k + 1]
+                    delta = D[a, c] + D[b, d] - D[a, b] - D[c, d]
+                    if delta < best_delta:
+                        best_k, best_delta = k, delta
+                if best_k >= 0:
+                    _reverse(route, i, best_k)
+                    improved = True
+        return route
+
+    def nearest_neighbor_route(D):
+        return _nn_route(np.ascontiguousarray(D))
+
+    def two_opt(route, D, max_iters=200):
+        best = np.array(route, dtype=np.int64)
+        return _two_opt(best, np.ascontiguousarray(D), max_iters)
+
+    # Compile once per process at import so the first request doesn't pay
+    # JIT latency. No on-disk cache: serverless bundles are read-only.
+    _D = local_distance_matrix([(0.0, 0.0), (0.0, 0.01), (0.01, 0.01), (0.01, 0.0)])
+    two_opt(nearest_neighbor_route(_D), _D)
+    del _D